@@ -1,16 +1,24 @@
 # analyse_modes.py
 import os
+
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
-from typing import Any, Dict, Final, List, Optional
+from typing import Any, Dict, Final, List, Optional, Sequence
 from tqdm import tqdm
-from audio_analysis.audio_frame_analysis import analyze_frame, divide_into_frames, calculate_effective_cutoff
+from audio_analysis.audio_frame_analysis import (
+    analyze_frames_batch,
+    calculate_effective_cutoff,
+    configure_fft_workers,
+    divide_into_frames,
+)
 from audio_analysis.audio_loader import load_flac
 
 from caching_and_duplicate_detection.audio_cache import AudioCache
 from caching_and_duplicate_detection.cache_models import ANALYZER_VERSION
-from audio_analysis.file_status_determination import determine_file_status
-from audio_analysis.data_and_error_logging import append_results_to_csv
+from audio_analysis.file_status_determination import PROBE_CUTOFFS_HZ, determine_file_status
+from audio_analysis.data_and_error_logging import CsvResultWriter
 from audio_analysis.data_and_error_logging import create_csv_path
 from audio_analysis.spectrogram_generator import (
     ffmpeg_works,
@@ -18,8 +26,6 @@ from audio_analysis.spectrogram_generator import (
     single_spectrogram,
 )
 
-BATCH_SIZE = 50 #number of entries to be written in the .csv file at once
-
 RESULT_FIELDNAMES: Final[List[str]] = [
     "path",
     "status",
@@ -32,10 +38,32 @@ RESULT_FIELDNAMES: Final[List[str]] = [
     "per_cutoff_active_fraction",
 ]
 
-def _format_fractions_for_csv(fractions: Optional[Dict[float, float]]) -> str:
+def _iter_flac_files(folder_path):
+    """Yield .flac paths lazily via scandir, depth-first.
+
+    Unreadable directories are skipped, matching the old eager scan; only the
+    directory stack is held in memory, so huge trees never materialize a full
+    path list.
+    """
+    stack = [folder_path]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and entry.name.lower().endswith(".flac"):
+                        yield entry.path
+        except OSError:
+            pass
+
+
+def _format_fractions_for_csv(fractions: Optional[Sequence[tuple[float, float]]]) -> str:
     if not fractions:
         return ""
-    return ";".join(f"{int(k)}={v:.4f}" for k, v in sorted(fractions.items()))
+    # Pairs arrive sorted by cutoff (probe order), so no per-row sort or dict.
+    return ";".join(f"{int(k)}={v:.4f}" for k, v in fractions)
 
 
 def generate_single_file_spectrogram_if_upscaled(
@@ -66,43 +94,68 @@ def generate_single_file_spectrogram_if_upscaled(
             print(message)
         return None, message
 
-def analyse_single_file(
+def _lookup_cached_analysis(
     file_path,
-    want_verbose,
-    *,
-    cache: AudioCache | None = None,
-    refresh_cache: bool = False,
+    cache: AudioCache | None,
+    refresh_cache: bool,
 ):
-    file_id = None
-    if cache is not None:
-        file_id = cache.upsert_file(
-            Path(file_path),
-            audio_info={"extension": Path(file_path).suffix.lower()},
-        )
-        if file_id is not None and not refresh_cache:
-            cached_result = cache.get_cached_analysis(file_id, ANALYZER_VERSION)
-            if cached_result is not None:
-                cached_result["path"] = file_path
-                if want_verbose:
-                    print(f"Loaded cached analysis result for '{file_path}'.")
-                    print(
-                        f"Result: {cached_result['status']} "
-                        f"(Confidence: {(cached_result.get('confidence') or 0.0) * 100:.1f}%)"
-                    )
-                return cached_result
+    """Register the file in the cache and return (file_id, cached_result | None)."""
+    if cache is None:
+        return None, None
+    file_id = cache.upsert_file(
+        Path(file_path),
+        audio_info={"extension": Path(file_path).suffix.lower()},
+    )
+    if file_id is not None and not refresh_cache:
+        cached_result = cache.get_cached_analysis(file_id, ANALYZER_VERSION)
+        if cached_result is not None:
+            cached_result["path"] = file_path
+            return file_id, cached_result
+    return file_id, None
+
+
+def _store_analysis_in_cache(
+    cache: AudioCache | None,
+    file_id,
+    file_path,
+    result: Dict[str, Any],
+) -> None:
+    if cache is None or file_id is None:
+        return
+    samplerate = result.get("samplerate_hz") or 0
+    num_samples = result.get("num_samples") or 0
+    cache.upsert_file(
+        Path(file_path),
+        audio_info={
+            "extension": Path(file_path).suffix.lower(),
+            "duration_seconds": num_samples / samplerate if samplerate else None,
+            "sample_rate_hz": samplerate or None,
+        },
+    )
+    cache.save_analysis(file_id, ANALYZER_VERSION, result)
+
 
+def _compute_file_analysis(file_path, want_verbose):
+    """Pure-compute analysis of one file (no cache access), so it can run in a
+    worker process as well as in the parent."""
     # 1. Load audio
     data, samplerate = load_flac(file_path)
 
-    # 2. Divide into frames
+    # 2. Divide into frames (zero-copy stride view, one row per frame)
     frames = divide_into_frames(data)
 
     # 3. Calculate (once per file, then reuse everywhere)
     effective_cutoff_hz = calculate_effective_cutoff(samplerate)
 
-    # 4. Analyze each frame — use the same 'effective_cutoff' for all frames; also collect FFT cache for later reuse
-    fft_cache = []
-    ratios = [analyze_frame(frame, samplerate, effective_cutoff_hz, fft_cache_list=fft_cache) for frame in frames]
+    # 4. Analyze all frames in one batched FFT call — same 'effective_cutoff' for all frames.
+    #    Status determination only needs high-band ratios at the probe cutoffs,
+    #    so collect those as a compact summary instead of keeping every spectrum.
+    ratios, fft_cache = analyze_frames_batch(
+        frames,
+        samplerate,
+        effective_cutoff_hz,
+        summary_cutoffs_hz=PROBE_CUTOFFS_HZ,
+    )
 
     # 5. Determine status + confidence + fractions
     status, confidence, fractions = determine_file_status(ratios, effective_cutoff_hz, frame_ffts=fft_cache)  # CHANGED: pass cache
@@ -118,7 +171,7 @@ def analyse_single_file(
             "samplerate_hz": samplerate,
             "num_samples": len(data),
             "num_total_frames": len(frames),
-            "num_non-silent_frames": sum(r > 0 for r in ratios),
+            "num_non-silent_frames": int(np.count_nonzero(ratios > 0)),
             "effective_cutoff_hz": effective_cutoff_hz,
             "per_cutoff_active_fraction": _format_fractions_for_csv(fractions),
         }
@@ -127,26 +180,37 @@ def analyse_single_file(
     if want_verbose:
         print(f"Loaded '{file_path}' with sample rate {samplerate} Hz, {len(data)} samples.")
         print(f"Divided audio into {len(frames)} frames for analysis.")
-        print(f"Analyzed {len(frames)} frames ({sum(r > 0 for r in ratios)} non-silent).")
+        print(f"Analyzed {len(frames)} frames ({int(np.count_nonzero(ratios > 0))} non-silent).")
         print(f"Result: {status} (Confidence: {confidence * 100:.1f}%)")
         print("Energy-above-cutoff summary:")
 
         if fractions:
             print("[bitrate-debug] per_cutoff_active_fraction:")
-            for k, v in sorted(fractions.items()):
+            for k, v in fractions:
                 print(f"  {int(k)}: {v:.4f}")
 
-    if cache is not None and file_id is not None:
-        cache.upsert_file(
-            Path(file_path),
-            audio_info={
-                "extension": Path(file_path).suffix.lower(),
-                "duration_seconds": len(data) / samplerate if samplerate else None,
-                "sample_rate_hz": samplerate,
-            },
-        )
-        cache.save_analysis(file_id, ANALYZER_VERSION, result)
+    return result
+
 
+def analyse_single_file(
+    file_path,
+    want_verbose,
+    *,
+    cache: AudioCache | None = None,
+    refresh_cache: bool = False,
+):
+    file_id, cached_result = _lookup_cached_analysis(file_path, cache, refresh_cache)
+    if cached_result is not None:
+        if want_verbose:
+            print(f"Loaded cached analysis result for '{file_path}'.")
+            print(
+                f"Result: {cached_result['status']} "
+                f"(Confidence: {(cached_result.get('confidence') or 0.0) * 100:.1f}%)"
+            )
+        return cached_result
+
+    result = _compute_file_analysis(file_path, want_verbose)
+    _store_analysis_in_cache(cache, file_id, file_path, result)
     return result
 
 def analyse_folder_batch(
@@ -157,39 +221,45 @@ def analyse_folder_batch(
     csv_path: str | None = None,
 ):
     # 1. Recursive search for files in given folder
-    print("Discovering files...")
-    flac_file_paths: list[str] = []
     upscaled_flac_file_paths: list[str] = []
-    results_buffer = []
     csv_path = csv_path or create_csv_path(folder_path)
 
-    stack = [folder_path]
-    while stack:
-        path = stack.pop()
+    # 2. Run same operations as in run_single_file, but for every file found.
+    #    Analysis is CPU-bound and per-file independent, so uncached files are
+    #    fanned out to a process pool; cache lookups/stores and CSV writes stay
+    #    in the parent (the SQLite handle must not cross process boundaries).
+    #    Discovery streams from _iter_flac_files and submissions are capped at
+    #    a bounded in-flight window, so neither the path list nor the future
+    #    set grows with the size of the tree.
+    print("Processing files...")
+
+    def record_result(flac_file_path, result):
+        # 3. Group the paths for the upscaled files
+        if result.get("status") != "Likely ORIGINAL":
+            upscaled_flac_file_paths.append(flac_file_path)
+
+        # 4. Stream the result row out through the persistent CSV handle
         try:
-            with os.scandir(path) as it:
-                for entry in it:
-                    if entry.is_dir(follow_symlinks=False):
-                        stack.append(entry.path)
-                    elif entry.is_file(follow_symlinks=False) and entry.name.lower().endswith(".flac"):
-                        flac_file_paths.append(entry.path)
-        except OSError:
-            pass
-    print("Discovered {} files.".format(len(flac_file_paths)))
+            csv_writer.write_result(result)
+        except Exception as e:
+            # At this point we cannot log to CSV; surface a clear message and stop the batch.
+            print(f"[FATAL] CSV write failed: {folder_path}\n  {type(e).__name__}: {e}")
+            raise
 
-    # 2. Run same operations as in run_single_file, but for every file found
-    print("Processing files...")
-    for flac_file_path in tqdm(flac_file_paths, desc="Files processed"):
+    cores = os.cpu_count() or 1
+    max_workers = max(1, cores - 1)
+    max_in_flight = max_workers * 4
+
+    pending: dict = {}
+    progress = tqdm(desc="Files processed", unit="file")
+
+    def complete_one(future):
+        flac_file_path, file_id = pending.pop(future)
         result = {"path": flac_file_path, "status": ""}
 
         try:
-            result = analyse_single_file(
-                flac_file_path,
-                want_verbose=False,
-                cache=cache,
-                refresh_cache=refresh_cache,
-            )
-
+            result = future.result()
+            _store_analysis_in_cache(cache, file_id, flac_file_path, result)
         except Exception as e:
             # Keep a minimal, schema-safe error row
             result.update(
@@ -207,24 +277,47 @@ def analyse_folder_batch(
 
             print(f"[ERROR] run_single_file failed for: {flac_file_path}\n  {type(e).__name__}: {e}")
 
-        # 3. Group the paths for the upscaled files
-        if result.get("status") != "Likely ORIGINAL":
-            upscaled_flac_file_paths.append(flac_file_path)
+        record_result(flac_file_path, result)
+        progress.update(1)
 
-        # 4. Save the results of all audio files in a buffer
-        results_buffer.append(result)
-        if len(results_buffer) >= BATCH_SIZE:
+    # Each worker pins its FFT stage to a single thread: with max_workers
+    # processes already saturating the machine, per-transform threading would
+    # only oversubscribe every core.  The single-file path keeps the default
+    # multi-threaded transforms.
+    with CsvResultWriter(csv_path) as csv_writer, ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=configure_fft_workers,
+        initargs=(1,),
+    ) as executor:
+        for flac_file_path in _iter_flac_files(folder_path):
             try:
-                append_results_to_csv(csv_path, results_buffer)
+                file_id, cached_result = _lookup_cached_analysis(flac_file_path, cache, refresh_cache)
             except Exception as e:
-                # At this point we cannot log to CSV; surface a clear message and stop the batch.
-                print(f"[FATAL] CSV write failed: {folder_path}\n  {type(e).__name__}: {e}")
-                raise
-            results_buffer.clear()
-
-    if results_buffer:
-        append_results_to_csv(csv_path, results_buffer)
-        results_buffer.clear()
+                # A file can vanish or turn unreadable between discovery and
+                # lookup; treat it as uncached so the worker's own failure
+                # produces the schema-safe ERROR row instead of aborting the run.
+                print(f"[WARN] cache lookup failed for: {flac_file_path}\n  {type(e).__name__}: {e}")
+                file_id, cached_result = None, None
+            if cached_result is not None:
+                record_result(flac_file_path, cached_result)
+                progress.update(1)
+                continue
+
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for finished in done:
+                    complete_one(finished)
+
+            future = executor.submit(_compute_file_analysis, flac_file_path, False)
+            pending[future] = (flac_file_path, file_id)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for finished in done:
+                complete_one(finished)
+
+    progress.close()
+    print(f"Processed {progress.n} files.")
 
     print("Generating spectrograms for upscaled files...")
     generate_spectrogram_threads(folder_path, upscaled_flac_file_paths)
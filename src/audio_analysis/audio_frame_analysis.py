@@ -1,14 +1,118 @@
 # audio_frame_analysis.py
+import os
+
 import numpy as np
 from dataclasses import dataclass
 from functools import lru_cache
 
-from scipy.fft import rfft, rfftfreq
-from scipy.signal.windows import hann
+import scipy.fft
+from scipy.fft import next_fast_len, rfft, rfftfreq
+from scipy.signal import get_window
+
+# Optional FFTW backend: FFTW's AVX kernels beat SciPy's pocketfft wheels for
+# our fixed 32768-sample transform, and the interfaces cache reuses plans
+# across calls instead of re-planning per file.  The batch leading dimension
+# varies per file, so we keep the default FFTW_ESTIMATE planner (MEASURE would
+# re-pay its planning cost for every new batch shape) and let the plan cache
+# do the amortizing.  Falls back silently to pocketfft when pyfftw is absent.
+try:
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60.0)
+    pyfftw.config.NUM_THREADS = os.cpu_count() or 1
+    scipy.fft.set_global_backend(pyfftw.interfaces.scipy_fft, try_last=True)
+except ImportError:
+    pyfftw = None
+
+# Optional Numba kernel: fuses abs + total-sum + high-band-sum + the
+# per-cutoff tail sums into one pass over the raw complex rfft output,
+# instead of materializing the magnitude array and reading it several times.
+# The post-FFT stage is memory-bound, so the single pass roughly halves its
+# DRAM traffic.  Falls back to the numpy reductions when numba is absent.
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Optional GPU offload: when cupy is installed and a CUDA device is visible,
+# the windowed batch is shipped to cuFFT and reduced on the GPU, with only the
+# small per-frame vectors coming back.  Any import or runtime failure simply
+# leaves the CPU paths in charge.
+try:
+    import cupy
+
+    if cupy.cuda.runtime.getDeviceCount() < 1:
+        cupy = None
+except Exception:
+    cupy = None
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _reduce_spectra_fused(spec_complex, k, boundaries):
+        # boundaries holds the (sorted, unique) probe-cutoff bin indices;
+        # tail_sums[i, t] accumulates the magnitudes at bins >= boundaries[t],
+        # built as per-segment sums plus one suffix pass, mirroring the
+        # reduceat + reversed-cumsum reduction of the numpy path.
+        nframes, nbins = spec_complex.shape
+        nb = boundaries.shape[0]
+        total_energies = np.empty(nframes, dtype=np.float64)
+        high_band_energies = np.empty(nframes, dtype=np.float64)
+        tail_sums = np.zeros((nframes, nb), dtype=np.float64)
+        for i in numba.prange(nframes):
+            total = 0.0
+            high = 0.0
+            t = -1  # current segment: boundaries[t] <= j < boundaries[t + 1]
+            for j in range(nbins):
+                magnitude = abs(spec_complex[i, j])
+                total += magnitude
+                if j > k:
+                    high += magnitude
+                while t + 1 < nb and j >= boundaries[t + 1]:
+                    t += 1
+                if t >= 0:
+                    tail_sums[i, t] += magnitude
+            for t in range(nb - 2, -1, -1):
+                tail_sums[i, t] += tail_sums[i, t + 1]
+            total_energies[i] = total
+            high_band_energies[i] = high
+        return total_energies, high_band_energies, tail_sums
+else:
+    _reduce_spectra_fused = None
 
 CUTOFF_HZ: float = 20_500.0
 NYQUIST_SAFETY_BAND_HZ: float = 100.0
 
+FRAME_SIZE: int = 32768
+FRAME_STEP: int = 16384
+SILENCE_PEAK_THRESHOLD: float = 1e-4
+
+# Threads used per FFT call (scipy's workers argument): -1 means all cores,
+# which is right when one file is analyzed at a time.  Process-pool workers
+# call configure_fft_workers(1) instead, so that parallelism comes from the
+# pool rather than cores-squared FFT threads.
+FFT_WORKERS: int = -1
+
+# Transform length for the real FFT.  next_fast_len() picks the smallest
+# length >= FRAME_SIZE with an optimal radix decomposition; rfft(n=N_FFT)
+# zero-pads the windowed frame when the two differ (for the power-of-two
+# FRAME_SIZE this is a no-op, but it keeps the FFT stage optimal if the
+# frame size ever changes).
+N_FFT: int = next_fast_len(FRAME_SIZE, real=True)
+
+# Opt-in half-precision staging for the GPU offload.  float16 halves the
+# host->device transfer of the windowed batch; the FFT itself still runs in
+# float32 after a cheap on-device upcast.  numpy has no bfloat16, and
+# pocketfft has no half-precision kernels (it would upcast on the CPU anyway,
+# turning the "quantization" into a pure extra conversion pass), so the flag
+# deliberately affects only the CuPy path.  float16 keeps ~3 significant
+# digits, which is ample for thresholded energy ratios, but it stays off by
+# default.
+FFT_HALF_PRECISION_TRANSFER: bool = (
+    os.environ.get("AUDIO_ANALYZER_FFT_HALF", "").strip().lower() in ("1", "true", "yes")
+)
+
 
 @dataclass
 class FrameFFT:
@@ -17,11 +121,42 @@ class FrameFFT:
     total_energy: float
 
 
-def divide_into_frames(data, frame_size=32768, step=16384):
-    frames = []
-    for start in range(0, len(data) - frame_size + 1, step):
-        frames.append(data[start:start + frame_size])
-    return frames
+@dataclass
+class FrameFFTBatch:
+    # Structure-of-arrays FFT cache for a whole file: one shared frequency
+    # axis, one (nframes, nbins) magnitude matrix, one (nframes,) energy
+    # vector.  Silent/invalid frames keep zero rows and total_energy 0.0.
+    freqs_hz: np.ndarray
+    spectra: np.ndarray
+    total_energies: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.total_energies.shape[0])
+
+
+@dataclass
+class FrameRatioSummary:
+    # Compact stand-in for FrameFFTBatch when downstream only needs high-band
+    # ratios at known probe cutoffs: (ncutoffs, nframes) instead of keeping
+    # the whole (nframes, nbins) spectra matrix alive after the FFT stage.
+    cutoffs_hz: np.ndarray
+    ratios: np.ndarray
+    valid: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.valid.shape[0])
+
+
+def divide_into_frames(data, frame_size=FRAME_SIZE, step=FRAME_STEP):
+    # Zero-copy (nframes, frame_size) view over overlapping frames; rows share
+    # the underlying sample buffer via stride tricks, so no per-frame slices.
+    # Iterating the rows matches the old list-of-slices behaviour.
+    if data.ndim > 1:
+        data = data[:, 0]
+    data = np.asarray(data, dtype=np.float32)
+    if data.shape[0] < frame_size:
+        return np.empty((0, frame_size), dtype=np.float32)
+    return np.lib.stride_tricks.sliding_window_view(data, frame_size)[::step]
 
 
 def calculate_effective_cutoff(samplerate):
@@ -32,8 +167,13 @@ def calculate_effective_cutoff(samplerate):
 
 @lru_cache(maxsize=64)
 def _hann_window(n: int, dtype_str: str) -> np.ndarray:
-    # np.hanning(n) == symmetric Hann -> scipy hann(n, sym=True)
-    return hann(n, sym=True).astype(np.dtype(dtype_str), copy=False)
+    # get_window("hann", n, fftbins=False) is the symmetric Hann, identical to
+    # hann(n, sym=True) / np.hanning(n) — the window this analysis has always
+    # used.  pocketfft places no symmetry requirement on the input, so staying
+    # symmetric (rather than the periodic fftbins=True variant) keeps ratios
+    # comparable with previously cached results.  lru_cache means the window
+    # is built once per unique (n, dtype) for the whole run.
+    return get_window("hann", n, fftbins=False).astype(np.dtype(dtype_str), copy=False)
 
 
 @lru_cache(maxsize=256)
@@ -49,6 +189,204 @@ def _cutoff_bin(n: int, samplerate: float, cutoff_hz: float) -> int:
     return max(0, min(k, n // 2))
 
 
+# One scratch allocation per key, recycled across files.  Folder runs hit
+# this once per file with near-identical shapes, so the allocator (and the
+# page-faulting that comes with fresh multi-MB arrays) is paid only when a
+# longer file needs a bigger buffer.  Each analysis process has its own pool;
+# nothing here is shared across processes or threads.
+_SCRATCH_POOL: dict[str, np.ndarray] = {}
+
+
+def _scratch_buffer(key: str, shape: tuple, dtype) -> np.ndarray:
+    needed = int(np.prod(shape))
+    buffer = _SCRATCH_POOL.get(key)
+    if buffer is None or buffer.size < needed or buffer.dtype != np.dtype(dtype):
+        buffer = np.empty(needed, dtype=dtype)
+        _SCRATCH_POOL[key] = buffer
+    return buffer[:needed].reshape(shape)
+
+
+def configure_fft_workers(workers: int) -> None:
+    """Pin the parallelism of the FFT stage to `workers` threads.
+
+    Covers the scipy workers argument, FFTW's thread count, and Numba's
+    thread pool.  Called with 1 from each process-pool worker so folder runs
+    scale by process instead of oversubscribing every core per transform.
+    """
+    global FFT_WORKERS
+    workers = int(workers)
+    FFT_WORKERS = workers
+    effective = workers if workers > 0 else (os.cpu_count() or 1)
+    if pyfftw is not None:
+        pyfftw.config.NUM_THREADS = effective
+    if numba is not None:
+        numba.set_num_threads(effective)
+
+
+def _gpu_spectra_reductions(windowed, k, boundaries):
+    """FFT + reductions on the GPU; returns numpy (totals, highs, tail_sums).
+
+    tail_sums is an (nlive, len(boundaries)) matrix of high-band tail sums, or
+    None when no boundaries were requested.  Returns None on any CUDA failure
+    so the caller falls back to the CPU paths.
+    """
+    try:
+        if FFT_HALF_PRECISION_TRANSFER:
+            windowed = windowed.astype(np.float16)
+        x = cupy.asarray(windowed)
+        if x.dtype != cupy.float32:
+            x = x.astype(cupy.float32)
+        spectra = cupy.abs(cupy.fft.rfft(x, n=N_FFT, axis=1))
+        total_energies = spectra.sum(axis=1, dtype=cupy.float64)
+        high_band_energies = spectra[:, k + 1:].sum(axis=1, dtype=cupy.float64)
+        tail_sums = None
+        if boundaries is not None and boundaries.size > 0:
+            tail_sums = cupy.stack(
+                [spectra[:, int(idx):].sum(axis=1, dtype=cupy.float64) for idx in boundaries],
+                axis=1,
+            )
+        return (
+            cupy.asnumpy(total_energies),
+            cupy.asnumpy(high_band_energies),
+            cupy.asnumpy(tail_sums) if tail_sums is not None else None,
+        )
+    except Exception:
+        return None
+
+
+def analyze_frames_batch(frames, samplerate, effective_cutoff, collect_fft=False, summary_cutoffs_hz=None):
+    """Batched equivalent of analyze_frame() over a (nframes, n) frame matrix.
+
+    One 2-D rfft call lets pocketfft vectorize across the batch axis and fan
+    out across FFT_WORKERS threads, instead of paying plan lookup + Python
+    dispatch once per frame.  Returns (ratios, cache): a (nframes,) float
+    array of high-band/total energy ratios (0.0 for silent or invalid frames)
+    plus an optional cache for downstream status determination — a
+    FrameFFTBatch with the full spectra when collect_fft is set, or, when
+    summary_cutoffs_hz is given instead, a FrameRatioSummary with the
+    per-cutoff ratios only (computed here while the spectra are still hot,
+    so the (nframes, nbins) matrix never outlives this call).
+    """
+    frames = np.asarray(frames, dtype=np.float32)
+    nframes = frames.shape[0]
+    ratios = np.zeros(nframes, dtype=np.float64)
+    freqs = _rfftfreq_cached(N_FFT, float(samplerate))
+    fft_batch = None
+    summary = None
+    if collect_fft:
+        fft_batch = FrameFFTBatch(
+            freqs_hz=freqs,
+            spectra=np.zeros((nframes, N_FFT // 2 + 1), dtype=np.float32),
+            total_energies=np.zeros(nframes, dtype=np.float64),
+        )
+    elif summary_cutoffs_hz is not None:
+        summary = FrameRatioSummary(
+            cutoffs_hz=np.asarray(sorted(float(c) for c in summary_cutoffs_hz)),
+            ratios=np.zeros((len(summary_cutoffs_hz), nframes), dtype=np.float64),
+            valid=np.zeros(nframes, dtype=bool),
+        )
+    if nframes == 0:
+        return ratios, fft_batch if fft_batch is not None else summary
+
+    n = frames.shape[1]
+
+    # Silent frames are skipped before the FFT, same threshold as
+    # analyze_frame().  max(x) / -min(x) gives the peak magnitude without
+    # materializing |frames|, which for the overlapped stride view would be a
+    # temporary roughly twice the size of the decoded audio.
+    peaks = np.maximum(frames.max(axis=1), -frames.min(axis=1))
+    live_mask = peaks >= SILENCE_PEAK_THRESHOLD
+    nlive = int(np.count_nonzero(live_mask))
+
+    if nlive > 0:
+        # Gather the live frames into a pooled C-contiguous scratch buffer
+        # (recycled across files) and apply the window in place: one
+        # SIMD-friendly pass over contiguous rows, no fresh (nlive, n)
+        # allocation per file.
+        live_frames = _scratch_buffer("windowed", (nlive, n), np.float32)
+        np.compress(live_mask, frames, axis=0, out=live_frames)
+        w = _hann_window(n, live_frames.dtype.str)
+        np.multiply(live_frames, w, out=live_frames)
+        windowed = live_frames
+
+        k = _cutoff_bin(N_FFT, float(samplerate), float(effective_cutoff))
+
+        nbins = N_FFT // 2 + 1
+        bin_indices = None
+        boundaries = None
+        if summary is not None:
+            bin_indices = [
+                int(np.searchsorted(freqs, cutoff_hz, side="right"))
+                for cutoff_hz in summary.cutoffs_hz
+            ]
+            boundaries = np.unique([idx for idx in bin_indices if idx < nbins])
+
+        tail_sums = None
+        gpu_result = None
+        if cupy is not None and not collect_fft:
+            gpu_result = _gpu_spectra_reductions(windowed, k, boundaries)
+
+        if gpu_result is not None:
+            total_energies, high_band_energies, tail_sums = gpu_result
+        elif not collect_fft and _reduce_spectra_fused is not None:
+            # Nobody needs the magnitude array: reduce straight off the
+            # complex rfft output in one fused pass, including the per-cutoff
+            # tails when a summary was requested.
+            spec_complex = rfft(windowed, n=N_FFT, axis=1, workers=FFT_WORKERS)
+            total_energies, high_band_energies, fused_tails = _reduce_spectra_fused(
+                spec_complex,
+                k,
+                boundaries if boundaries is not None else np.empty(0, dtype=np.int64),
+            )
+            if summary is not None:
+                tail_sums = fused_tails
+        else:
+            spec_complex = rfft(windowed, n=N_FFT, axis=1, workers=FFT_WORKERS)
+            spectra = np.abs(
+                spec_complex,
+                out=_scratch_buffer("spectra", spec_complex.shape, np.float32),
+            )
+            total_energies = spectra.sum(axis=1)
+            high_band_energies = spectra[:, k + 1:].sum(axis=1)
+
+            if boundaries is not None and boundaries.size > 0:
+                # Same one-pass reduceat reduction used for the SoA cache:
+                # segment sums between consecutive cutoff bins, suffix-
+                # accumulated into every high-band tail, while the spectra
+                # are still in cache.
+                segment_sums = np.add.reduceat(spectra, boundaries, axis=1, dtype=np.float64)
+                tail_sums = np.cumsum(segment_sums[:, ::-1], axis=1)[:, ::-1]
+
+        valid = (total_energies > 0.0) & np.isfinite(total_energies)
+        live_ratios = np.zeros(nlive, dtype=np.float64)
+        np.divide(high_band_energies, total_energies, out=live_ratios, where=valid)
+        ratios[live_mask] = live_ratios
+
+        if fft_batch is not None:
+            fft_batch.spectra[live_mask] = spectra
+            fft_batch.total_energies[live_mask] = np.where(valid, total_energies, 0.0)
+
+        if summary is not None:
+            if tail_sums is not None:
+                for row, idx in enumerate(bin_indices):
+                    if idx >= nbins:
+                        continue
+                    cutoff_ratios = np.zeros(nlive, dtype=np.float64)
+                    np.divide(
+                        tail_sums[:, int(np.searchsorted(boundaries, idx))],
+                        total_energies,
+                        out=cutoff_ratios,
+                        where=valid,
+                    )
+                    summary.ratios[row, live_mask] = cutoff_ratios
+            summary.valid[live_mask] = valid
+
+    if __debug__:
+        assert np.all(np.isfinite(ratios)), "Non-finite ratio produced in analyze_frames_batch()"
+
+    return ratios, fft_batch if fft_batch is not None else summary
+
+
 def analyze_frame(single_frame, samplerate, effective_cutoff, fft_cache_list=None):
     if single_frame.ndim > 1:
         single_frame = single_frame[:, 0]
@@ -56,7 +394,7 @@ def analyze_frame(single_frame, samplerate, effective_cutoff, fft_cache_list=Non
     # If you want to keep float64, remove the astype; float32 is usually faster.
     x = np.asarray(single_frame, dtype=np.float32)
 
-    if np.max(np.abs(x)) < 1e-4:
+    if np.max(np.abs(x)) < SILENCE_PEAK_THRESHOLD:
         if fft_cache_list is not None:
             fft_cache_list.append(FrameFFT(np.array([]), np.array([]), 0.0))
         return 0.0
@@ -70,24 +408,26 @@ def analyze_frame(single_frame, samplerate, effective_cutoff, fft_cache_list=Non
     windowed = np.empty(n, dtype=x.dtype)
     np.multiply(x, w, out=windowed)
 
-    # FFT + magnitude
-    spectrum = np.abs(rfft(windowed))
+    # FFT + magnitude (zero-padded to the fast transform length).
+    # FFT_WORKERS lets pocketfft split even this single transform across
+    # cores, matching the batched path.
+    spectrum = np.abs(rfft(windowed, n=N_FFT, workers=FFT_WORKERS))
 
     total_energy = float(spectrum.sum())
     if total_energy <= 0.0 or not np.isfinite(total_energy):
         if fft_cache_list is not None:
             # only compute freqs if you really store them
-            freqs = _rfftfreq_cached(n, float(samplerate))
+            freqs = _rfftfreq_cached(N_FFT, float(samplerate))
             fft_cache_list.append(FrameFFT(freqs, spectrum, 0.0))
         return 0.0
 
     # High-band sum without boolean mask: use cutoff bin
-    k = _cutoff_bin(n, float(samplerate), float(effective_cutoff))
+    k = _cutoff_bin(N_FFT, float(samplerate), float(effective_cutoff))
     high_band_energy = float(spectrum[k + 1 :].sum())
     ratio = high_band_energy / total_energy
 
     if fft_cache_list is not None:
-        freqs = _rfftfreq_cached(n, float(samplerate))
+        freqs = _rfftfreq_cached(N_FFT, float(samplerate))
         fft_cache_list.append(FrameFFT(freqs_hz=freqs, spectrum_abs=spectrum, total_energy=total_energy))
 
     if __debug__:
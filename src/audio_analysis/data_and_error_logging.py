@@ -23,6 +23,55 @@ def create_csv_path(folder_path):
     dated_csv_path = os.path.join(folder_path, current_daytime_formatted + ".csv")
     return dated_csv_path
 
+class CsvResultWriter:
+    """Streams result rows to a CSV file through one persistent handle.
+
+    append_results_to_csv() re-opens the file and rebuilds a DictWriter for
+    every batch; for long folder runs that is a filesystem round-trip per
+    flush.  This keeps the handle open for the whole run, writes plain list
+    rows via csv.writer (no per-row dict filtering), and flushes after each
+    row so a crash loses at most the row in flight.
+    """
+
+    def __init__(self, csv_path: str, fieldnames: Iterable[str] = RESULT_FIELDNAMES) -> None:
+        self._csv_path = csv_path
+        self._fieldnames = list(fieldnames)
+        self._confidence_index = (
+            self._fieldnames.index("confidence") if "confidence" in self._fieldnames else -1
+        )
+        self._file = None
+        self._writer = None
+
+    def __enter__(self) -> "CsvResultWriter":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def open(self) -> None:
+        file_exists = os.path.isfile(self._csv_path)
+        self._file = open(self._csv_path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file, quoting=csv.QUOTE_MINIMAL)
+        if not file_exists:
+            self._writer.writerow(self._fieldnames)
+
+    def write_result(self, result: Dict[str, Any]) -> None:
+        row = [result.get(k, "") for k in self._fieldnames]
+
+        if self._confidence_index >= 0 and isinstance(row[self._confidence_index], (float, int)):
+            row[self._confidence_index] = f"{float(row[self._confidence_index]):.6f}"
+
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+
 def append_results_to_csv(
     csv_path: str,
     results: Sequence[Dict[str, Any]],
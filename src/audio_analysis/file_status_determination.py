@@ -1,6 +1,8 @@
 # file_status_determination.py
 import numpy as np
 
+from audio_analysis.audio_frame_analysis import FrameFFTBatch, FrameRatioSummary
+
 ENERGY_RATIO_THRESHOLD: float = 1e-3        # 0.001% energy above cutoff => frame has HF content
 MIN_ACTIVE_FRACTION: float   = 0.05         # >=5% frames with HF content => Original
 RATIO_DROP_THRESHOLD: float  = 1e-5         # drop near-silent/invalid frames
@@ -30,9 +32,77 @@ def debug_energy_ratios(ratios):            # Mainly debug function
         "hf_ratio_mean": float(np.mean(x)),
     }
 
+def _active_fractions_from_batch(fft_batch, cutoffs_hz, energy_ratio_threshold, ratio_drop_threshold):
+    """Active fraction for each cutoff (ascending), one pass over the spectra.
+
+    Summing spectra[:, idx:] separately per cutoff re-reads the whole matrix
+    once per probe.  Instead, np.add.reduceat sums the segments between
+    consecutive cutoff bins in a single pass (accumulated in float64), and a
+    reversed cumulative sum over those few segment columns yields every
+    high-band tail at once.
+    """
+    fractions = [0.0] * len(cutoffs_hz)
+    total_energies = fft_batch.total_energies
+    valid = total_energies > 0.0
+    if not np.any(valid):
+        return fractions
+
+    spectra = fft_batch.spectra[valid]
+    total_energies = total_energies[valid]
+    nbins = spectra.shape[1]
+
+    bin_indices = [
+        int(np.searchsorted(fft_batch.freqs_hz, cutoff_hz, side="right"))
+        for cutoff_hz in cutoffs_hz
+    ]
+    boundaries = np.unique([idx for idx in bin_indices if idx < nbins])
+    if boundaries.size == 0:
+        return fractions
+
+    segment_sums = np.add.reduceat(spectra, boundaries, axis=1, dtype=np.float64)
+    # tail_sums[:, j] == spectra[:, boundaries[j]:].sum(axis=1)
+    tail_sums = np.cumsum(segment_sums[:, ::-1], axis=1)[:, ::-1]
+
+    for out_pos, idx in enumerate(bin_indices):
+        if idx >= nbins:
+            continue
+        ratios = tail_sums[:, int(np.searchsorted(boundaries, idx))] / total_energies
+        counted = ratios > float(ratio_drop_threshold)
+        total = int(np.count_nonzero(counted))
+        if total == 0:
+            continue
+        active = int(np.count_nonzero(ratios > float(energy_ratio_threshold)))
+        fractions[out_pos] = active / total
+    return fractions
+
+
+def _active_fraction_from_batch(fft_batch, cutoff_hz, energy_ratio_threshold, ratio_drop_threshold):
+    return _active_fractions_from_batch(fft_batch, [cutoff_hz], energy_ratio_threshold, ratio_drop_threshold)[0]
+
+
+def _active_fraction_from_summary(summary, cutoff_hz, energy_ratio_threshold, ratio_drop_threshold):
+    # The summary already carries per-frame high-band ratios for each probe
+    # cutoff, so only the counting thresholds remain to apply.
+    row = int(np.searchsorted(summary.cutoffs_hz, float(cutoff_hz)))
+    if row >= summary.cutoffs_hz.shape[0] or summary.cutoffs_hz[row] != float(cutoff_hz):
+        return 0.0
+
+    ratios = summary.ratios[row][summary.valid]
+    counted = ratios > float(ratio_drop_threshold)
+    total = int(np.count_nonzero(counted))
+    if total == 0:
+        return 0.0
+    active = int(np.count_nonzero(ratios > float(energy_ratio_threshold)))
+    return active / total
+
+
 def _active_fraction_from_cache(frame_ffts, cutoff_hz, energy_ratio_threshold, ratio_drop_threshold):
     if not frame_ffts:
         return 0.0
+    if isinstance(frame_ffts, FrameRatioSummary):
+        return _active_fraction_from_summary(frame_ffts, cutoff_hz, energy_ratio_threshold, ratio_drop_threshold)
+    if isinstance(frame_ffts, FrameFFTBatch):
+        return _active_fraction_from_batch(frame_ffts, cutoff_hz, energy_ratio_threshold, ratio_drop_threshold)
     active = 0
     total = 0
     for f in frame_ffts:
@@ -66,28 +136,43 @@ def _estimate_bitrate_from_cache(frame_ffts, effective_cutoff, energy_ratio_thre
     # Only evaluate valid cutoffs for this file
     probe_list = [c for c in probe_cutoffs_hz if c <= effective_cutoff]
     if not probe_list:
-        return None, None, {}
-
-    per_cutoff_fractions = {}
-    # 1) Compute fractions for ALL candidate cutoffs (NO early break)
-    for c in probe_list:
-        frac = _active_fraction_from_cache(frame_ffts, c, energy_ratio_threshold, ratio_drop_threshold)
-        per_cutoff_fractions[c] = frac
+        return None, None, []
+
+    # 1) Compute fractions for ALL candidate cutoffs (NO early break).
+    #    Kept as a (cutoff, fraction) list in ascending cutoff order, so
+    #    downstream consumers (CSV formatting, verbose prints) never need a
+    #    dict or a per-row sort.
+    if isinstance(frame_ffts, FrameRatioSummary):
+        per_cutoff_fractions = [
+            (c, _active_fraction_from_summary(frame_ffts, c, energy_ratio_threshold, ratio_drop_threshold))
+            for c in probe_list
+        ]
+    elif isinstance(frame_ffts, FrameFFTBatch):
+        # SoA cache: all probe cutoffs share one pass over the spectra matrix.
+        per_cutoff_fractions = list(
+            zip(
+                probe_list,
+                _active_fractions_from_batch(frame_ffts, probe_list, energy_ratio_threshold, ratio_drop_threshold),
+            )
+        )
+    else:
+        per_cutoff_fractions = [
+            (c, _active_fraction_from_cache(frame_ffts, c, energy_ratio_threshold, ratio_drop_threshold))
+            for c in probe_list
+        ]
 
     # 2) Select the FIRST cutoff where activity becomes "quiet" (ascending), and the previous cutoff (if any) was "loud".
     selected_cutoff = None
     selected_frac = None
 
-    for idx, c in enumerate(probe_list):  # ascending
-        frac = per_cutoff_fractions[c]
+    for idx, (c, frac) in enumerate(per_cutoff_fractions):  # ascending
         if frac <= MAX_HF_ACTIVE_FRACTION_FOR_CUTOFF:
             if idx == 0:
                 # No previous cutoff to compare; accept if quiet at the very first cutoff
                 selected_cutoff = c
                 selected_frac = frac
                 break
-            prev_c = probe_list[idx - 1]
-            prev_frac = per_cutoff_fractions[prev_c]
+            prev_frac = per_cutoff_fractions[idx - 1][1]
             if prev_frac >= MIN_PREV_CUTOFF_ACTIVE_FRACTION:
                 selected_cutoff = c
                 selected_frac = frac
@@ -95,10 +180,9 @@ def _estimate_bitrate_from_cache(frame_ffts, effective_cutoff, energy_ratio_thre
 
     if selected_cutoff is None:
         # fallback: if any quiet cutoffs exist, take the **lowest** quiet cutoff (safest upper bound)
-        quiet_cutoffs = [c for c in probe_list if per_cutoff_fractions[c] <= MAX_HF_ACTIVE_FRACTION_FOR_CUTOFF]
+        quiet_cutoffs = [(c, frac) for c, frac in per_cutoff_fractions if frac <= MAX_HF_ACTIVE_FRACTION_FOR_CUTOFF]
         if quiet_cutoffs:
-            selected_cutoff = quiet_cutoffs[0]
-            selected_frac = per_cutoff_fractions[selected_cutoff]
+            selected_cutoff, selected_frac = quiet_cutoffs[0]
         else:
             return None, None, per_cutoff_fractions
 
@@ -144,4 +228,4 @@ def determine_file_status(ratios, effective_cutoff, frame_ffts=None, probe_cutof
         return "Inconclusive (no cutoff match)", 0.0, per_cutoff_fractions
 
     # no cache available → cannot estimate bitrate profile
-    return "Inconclusive (no FFT cache)", 0.0, {}
\ No newline at end of file
+    return "Inconclusive (no FFT cache)", 0.0, []
\ No newline at end of file
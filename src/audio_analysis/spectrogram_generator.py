@@ -3,12 +3,16 @@ import os
 import subprocess
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 from tqdm import tqdm
 
 from config import FFMPEG_PATH
 
+@lru_cache(maxsize=1)
 def ffmpeg_works() -> bool:
+    # Probing ffmpeg spawns a subprocess; the answer doesn't change within a
+    # run, so cache it instead of paying the spawn once per analyzed file.
     if not FFMPEG_PATH.is_file():
         return False
     try:
@@ -22,31 +26,38 @@ def ffmpeg_works() -> bool:
     except OSError:
         return False
 
+SPECTROGRAM_WIDTH, SPECTROGRAM_HEIGHT = 1920, 1080 # 4K UHD output
+
+SPECTROGRAM_FILTER = (
+    f"showspectrumpic=s={SPECTROGRAM_WIDTH}x{SPECTROGRAM_HEIGHT}:legend=1:"
+    f"color=fiery:"
+    f"fscale=lin:"
+    f"win_func=hann:"
+    f"scale=log:"
+    f"gain=1:"
+    f"drange=120"
+)
+
+# Inputs rendered per ffmpeg process in batch mode; bounds the command-line
+# length while still amortizing process startup across several files.
+SPECTROGRAM_BATCH_SIZE = 8
+
+def _spectrogram_output_path(spectrogram_directory: Path, upscaled_file_path: Path) -> Path:
+    return (spectrogram_directory / upscaled_file_path.name).with_suffix(".jpeg")
+
 def single_spectrogram(spectrogram_directory: Path, upscaled_file_path: str | Path) -> Path:
     upscaled_file_path = Path(upscaled_file_path)
 
-    out_path = (spectrogram_directory / upscaled_file_path.name).with_suffix(".jpeg")
+    out_path = _spectrogram_output_path(spectrogram_directory, upscaled_file_path)
     if out_path.is_file() and out_path.stat().st_size > 0:
         return out_path
 
-    w, h = 1920, 1080 # 4K UHD output
-
-    lavfi = (
-        f"showspectrumpic=s={w}x{h}:legend=1:"
-        f"color=fiery:"
-        f"fscale=lin:"
-        f"win_func=hann:"
-        f"scale=log:"
-        f"gain=1:"
-        f"drange=120"
-    )
-
     cmd = [
         str(FFMPEG_PATH),
         "-hide_banner", "-loglevel", "error",
         "-y",
         "-i", str(upscaled_file_path),
-        "-lavfi", lavfi,
+        "-lavfi", SPECTROGRAM_FILTER,
         "-frames:v", "1",
         str(out_path),
     ]
@@ -54,6 +65,52 @@ def single_spectrogram(spectrogram_directory: Path, upscaled_file_path: str | Pa
     subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     return out_path
 
+def _spectrogram_batch(spectrogram_directory: Path, upscaled_file_paths: list[str]) -> list[str]:
+    """Render spectrograms for several inputs with one ffmpeg process.
+
+    Each input gets its own showspectrumpic branch in a single filter graph,
+    so one process startup covers the whole batch.  Returns the paths that
+    could not be rendered.
+    """
+    todo: list[tuple[Path, Path]] = []
+    for upscaled_file_path in upscaled_file_paths:
+        upscaled_file_path = Path(upscaled_file_path)
+        out_path = _spectrogram_output_path(spectrogram_directory, upscaled_file_path)
+        if out_path.is_file() and out_path.stat().st_size > 0:
+            continue
+        todo.append((upscaled_file_path, out_path))
+
+    if not todo:
+        return []
+
+    cmd = [
+        str(FFMPEG_PATH),
+        "-hide_banner", "-loglevel", "error",
+        "-y",
+    ]
+    for in_path, _ in todo:
+        cmd += ["-i", str(in_path)]
+    cmd += [
+        "-filter_complex",
+        ";".join(f"[{idx}:a]{SPECTROGRAM_FILTER}[s{idx}]" for idx in range(len(todo))),
+    ]
+    for idx, (_, out_path) in enumerate(todo):
+        cmd += ["-map", f"[s{idx}]", "-frames:v", "1", str(out_path)]
+
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return []
+    except (OSError, subprocess.CalledProcessError):
+        # One bad input fails the whole job; retry per file to isolate it.
+        failures: list[str] = []
+        for in_path, _ in todo:
+            try:
+                single_spectrogram(spectrogram_directory, in_path)
+            except Exception as e:
+                failures.append(str(in_path))
+                print(f"[ERROR] spectrogram failed for: {in_path}\n  {type(e).__name__}: {e}")
+        return failures
+
 def generate_spectrogram_threads(root_path: str, upscaled_flac_file_paths: list[str]):
     root_path = Path(root_path)
     spectrogram_directory = root_path / "spectrograms"
@@ -68,19 +125,24 @@ def generate_spectrogram_threads(root_path: str, upscaled_flac_file_paths: list[
 
     failures: list[str] = []
 
+    batches = [
+        upscaled_flac_file_paths[i:i + SPECTROGRAM_BATCH_SIZE]
+        for i in range(0, len(upscaled_flac_file_paths), SPECTROGRAM_BATCH_SIZE)
+    ]
+
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_path = {
-            executor.submit(single_spectrogram, spectrogram_directory, upscaled_flac_file_path): upscaled_flac_file_path
-            for upscaled_flac_file_path in upscaled_flac_file_paths
+        future_to_batch = {
+            executor.submit(_spectrogram_batch, spectrogram_directory, batch): batch
+            for batch in batches
         }
 
-        for future in tqdm(as_completed(future_to_path), total=len(future_to_path), desc="Spectrograms"):
-            upscaled_flac_file_path = future_to_path[future]
+        for future in tqdm(as_completed(future_to_batch), total=len(future_to_batch), desc="Spectrogram batches"):
+            batch = future_to_batch[future]
             try:
-                out_path = future.result()
+                failures.extend(future.result())
             except Exception as e:
-                failures.append(upscaled_flac_file_path)
-                print(f"[ERROR] spectrogram failed for: {upscaled_flac_file_path}\n  {type(e).__name__}: {e}")
+                failures.extend(batch)
+                print(f"[ERROR] spectrogram batch failed for: {batch}\n  {type(e).__name__}: {e}")
 
     print(f"Spectrograms generated. failed={len(failures)} / total={len(upscaled_flac_file_paths)}")
     return None